@@ -2,13 +2,59 @@
 
 
 # 📚 Import Required Libraries
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import queue
+import signal
+import threading
+import time
+from collections import deque
+from contextlib import nullcontext
+from functools import lru_cache
+from types import SimpleNamespace
 import cv2
+import torch
+import torch.nn.functional as F
 from ultralytics import YOLO
-from deep_sort_realtime.deepsort_tracker import DeepSort
+from ultralytics.nn.autobackend import AutoBackend
+from ultralytics.utils import ops
+from ultralytics.engine.results import Boxes
+from ultralytics.trackers import BYTETracker
 import numpy as np
+from numba import njit, prange
 import tkinter as tk
 from tkinter import filedialog
 
+try:  # GPU decode/encode is optional, OpenCV is used without it
+    from torchaudio.io import StreamReader, StreamWriter
+    from torchaudio.utils import ffmpeg_utils
+except ImportError:
+    StreamReader = StreamWriter = ffmpeg_utils = None
+
+# ⚙️ Inference Settings
+MODEL_WEIGHTS = "yolov8m.pt"
+BATCH_SIZE = 8  # Frames sent to YOLO per call
+DETECT_EVERY = 2  # Run YOLO on every Nth frame, the tracker predicts the rest
+MODEL_MAX_SIDE = 640  # Longest side of the model input
+VEHICLE_CLASSES = np.array([2, 3, 5, 7])  # COCO car, motorcycle, bus, truck
+SCORE_THRESHOLD = 0.4
+NMS_IOU_THRESHOLD = 0.7  # Same as the Ultralytics predictor default
+
+# 🛰️ ByteTrack Settings (new tracks start from confident boxes, weaker ones
+# can still extend existing tracks)
+TRACKER_ARGS = SimpleNamespace(track_high_thresh=SCORE_THRESHOLD, track_low_thresh=0.1,
+                               new_track_thresh=SCORE_THRESHOLD, track_buffer=30,
+                               match_thresh=0.8, fuse_score=True)
+
+# 🖍️ Drawing Settings
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+LINE_COLOR = (0, 255, 0)
+COUNT_COLOR = (0, 255, 255)
+COUNT_ORIGIN = (20, 50)
+
 # 🎯 Video Selection Function
 def select_video():
     """Open file dialog to select video file."""
@@ -22,117 +68,611 @@ def select_video():
         raise ValueError("No video file selected")
     return video_path
 
+# 🎞️ GPU Codec Check Function
+def ffmpeg_codec_available(name, encoder=False):
+    """Check whether torchaudio's FFmpeg build provides the given GPU decoder (or encoder)."""
+    if ffmpeg_utils is None or not torch.cuda.is_available():
+        return False
+    codecs = ffmpeg_utils.get_video_encoders() if encoder else ffmpeg_utils.get_video_decoders()
+    return name in codecs
+
+# 🌈 YUV to RGB Conversion Function
+def yuv_to_rgb(frames):
+    """Convert a batch of NVDEC YUV444 frames to RGB uint8 without leaving the GPU."""
+    frames = frames.float()
+    y = frames[:, 0] / 255
+    u = frames[:, 1] / 255 - 0.5
+    v = frames[:, 2] / 255 - 0.5
+    rgb = torch.stack([y + 1.14 * v, y - 0.396 * u - 0.581 * v, y + 2.029 * u], dim=1)
+    return (rgb * 255).clamp_(0, 255).to(torch.uint8)
+
+# 🎬 Frame Reader Function
+def read_frames(video_path, cap, chunk_size):
+    """Yield (frame, frame_gpu) pairs, decoding H.264 on NVDEC when possible.
+
+    frame is the BGR image used for tracking and drawing. frame_gpu is the
+    same frame as an RGB CHW CUDA tensor when NVDEC decoded it, else None.
+    """
+    chunks = None
+    if ffmpeg_codec_available('h264_cuvid'):
+        # FFmpeg listing the decoder does not mean this GPU can decode the
+        # stream, so pull the first chunk before giving up on OpenCV
+        try:
+            reader = StreamReader(video_path)
+            if reader.get_src_stream_info(reader.default_video_stream).codec == 'h264':
+                reader.add_video_stream(frames_per_chunk=chunk_size, decoder="h264_cuvid",
+                                        hw_accel="cuda:0")
+                stream = reader.stream()
+                chunks = itertools.chain([next(stream)], stream)
+        except Exception as e:
+            print(f"NVDEC decoding failed ({e}), using OpenCV")
+            chunks = None
+    
+    if chunks is None:
+        while cap.isOpened():
+            ret, frame = cap.read()
+            if not ret:
+                return
+            yield frame, None
+        return
+    
+    print("Decoding video on the GPU (NVDEC)")
+    cap.release()  # Only needed for the video properties
+    for (chunk,) in chunks:
+        chunk = yuv_to_rgb(chunk)
+        # Tracking and drawing still need BGR images on the host
+        frames = chunk.flip(1).permute(0, 2, 3, 1).contiguous().cpu().numpy()
+        for frame, frame_gpu in zip(frames, chunk):
+            yield frame, frame_gpu
+
+# 📼 NVENC Video Writer
+class NvencWriter:
+    """cv2.VideoWriter look-alike that encodes H.264 on the GPU with NVENC."""
+
+    def __init__(self, output_path, fps, frame_width, frame_height):
+        self.writer = StreamWriter(output_path)
+        self.writer.add_video_stream(frame_rate=fps, width=frame_width, height=frame_height,
+                                     format="bgr24", encoder="h264_nvenc",
+                                     encoder_format="yuv420p")
+        self.writer.open()
+
+    def write(self, frame):
+        self.writer.write_video_chunk(0, torch.from_numpy(frame).permute(2, 0, 1).unsqueeze(0))
+
+    def release(self):
+        self.writer.close()
+
+# 🧵 Background Video Writer
+class AsyncVideoWriter:
+    """Wrap a video writer so frames are encoded on a background thread."""
+
+    def __init__(self, writer, maxsize=32):
+        self.writer = writer
+        self.queue = queue.Queue(maxsize)
+        self.error = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        try:
+            for frame in iter(self.queue.get, None):
+                self.writer.write(frame)
+        except Exception as e:
+            self.error = e
+            while self.queue.get() is not None:  # Keep draining so write() never blocks
+                pass
+
+    def write(self, frame):
+        if self.error is not None:
+            raise self.error
+        self.queue.put(frame)
+
+    def release(self):
+        self.queue.put(None)
+        self.thread.join()
+        self.writer.release()
+        if self.error is not None:
+            raise self.error
+
 # 📹 Video Writer Setup Function
 def setup_video_writer(video_path, cap):
     """Setup video writer with same properties as input video."""
     output_path = video_path.rsplit('.', 1)[0] + '_processed.mp4'
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
     frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
     frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
     fps = int(cap.get(cv2.CAP_PROP_FPS))
-    return cv2.VideoWriter(output_path, fourcc, fps, (frame_width, frame_height)), output_path
+    if ffmpeg_codec_available('h264_nvenc', encoder=True):
+        try:  # Listed by FFmpeg but absent on some GPUs (e.g. A100/H100)
+            out = NvencWriter(output_path, fps, frame_width, frame_height)
+            print("Encoding video on the GPU (NVENC)")
+            return out, output_path
+        except Exception as e:
+            print(f"NVENC encoding failed ({e}), using OpenCV")
+    
+    # Ask OpenCV's own FFmpeg for NVENC H.264 before the slow software mp4v codec.
+    # The option is read from the process environment, so it is only set for
+    # this one attempt and restored right after
+    previous_options = os.environ.get('OPENCV_FFMPEG_WRITER_OPTIONS')
+    os.environ['OPENCV_FFMPEG_WRITER_OPTIONS'] = 'video_codec;h264_nvenc'
+    try:
+        out = cv2.VideoWriter(output_path, cv2.CAP_FFMPEG, cv2.VideoWriter_fourcc(*'H264'),
+                              fps, (frame_width, frame_height))
+    finally:
+        if previous_options is None:
+            del os.environ['OPENCV_FFMPEG_WRITER_OPTIONS']
+        else:
+            os.environ['OPENCV_FFMPEG_WRITER_OPTIONS'] = previous_options
+    if out.isOpened():
+        return out, output_path
+    
+    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+    out = cv2.VideoWriter(output_path, fourcc, fps, (frame_width, frame_height))
+    if not out.isOpened():
+        raise ValueError(f"Could not open video writer: {output_path}")
+    return out, output_path
+
+# 📐 Model Input Size Function
+def model_input_size(frame_width, frame_height, max_side=MODEL_MAX_SIDE, stride=32):
+    """Scale the frame so its longest side is max_side, rounded to the model stride."""
+    scale = max_side / max(frame_width, frame_height)
+    height = max(stride, round(frame_height * scale / stride) * stride)
+    width = max(stride, round(frame_width * scale / stride) * stride)
+    return height, width
+
+# 🎯 INT8 Calibration Set Function
+def build_calibration_set(video_path, pt_path, num_images=200):
+    """Save about num_images evenly spaced frames plus a dataset yaml for INT8 calibration."""
+    calib_dir = video_path.rsplit('.', 1)[0] + '_calib'
+    yaml_path = os.path.join(calib_dir, 'calib.yaml')
+    if os.path.exists(yaml_path):
+        return yaml_path
+    
+    print("Sampling frames for INT8 calibration...")
+    image_dir = os.path.join(calib_dir, 'images')
+    os.makedirs(image_dir, exist_ok=True)
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise ValueError(f"Could not open video file for calibration: {video_path}")
+    step = max(1, int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) // num_images)
+    index = saved = 0
+    while saved < num_images and cap.grab():
+        if index % step == 0:
+            _, frame = cap.retrieve()
+            cv2.imwrite(os.path.join(image_dir, f'{saved:04d}.jpg'), frame)
+            saved += 1
+        index += 1
+    cap.release()
+    if saved == 0:  # Do not leave an empty dataset behind to be reused later
+        raise ValueError(f"No frames could be read for calibration: {video_path}")
+    
+    names = YOLO(pt_path).names
+    with open(yaml_path, 'w') as f:
+        f.write(f"path: {json.dumps(os.path.abspath(calib_dir))}\ntrain: images\nval: images\nnames:\n")
+        f.writelines(f"  {i}: {json.dumps(name)}\n" for i, name in names.items())
+    return yaml_path
+
+# ⚡ TensorRT Engine Export Function
+def get_engine(pt_path, imgsz, batch=1, int8_data=None):
+    """Export YOLO weights to a TensorRT FP16 engine once and return its path.
+
+    The engine is cached next to the .pt file, keyed by input size and batch
+    since TensorRT only profiles the shapes it was built for. FP16 tensor cores
+    only exist on Turing (compute capability 7.5) and newer GPUs, so older
+    cards keep the PyTorch weights. Passing a calibration dataset yaml as
+    int8_data builds an INT8 engine instead, cached per calibration set.
+    """
+    precision = 'fp16'
+    if int8_data:
+        calib_id = hashlib.sha1(os.path.abspath(int8_data).encode()).hexdigest()[:8]
+        precision = f'int8_{calib_id}'
+    engine_path = f"{os.path.splitext(pt_path)[0]}_{imgsz[0]}x{imgsz[1]}_b{batch}_{precision}.engine"
+    if os.path.exists(engine_path):
+        return engine_path
+    if not torch.cuda.is_available() or torch.cuda.get_device_capability() < (7, 5):
+        print("TensorRT FP16/INT8 needs a Turing or newer GPU, using PyTorch weights")
+        return pt_path
+    print(f"Exporting TensorRT {'INT8' if int8_data else 'FP16'} engine (one-time, this can take a few minutes)...")
+    try:
+        exported = YOLO(pt_path).export(format="engine", half=not int8_data, int8=bool(int8_data),
+                                        data=int8_data, dynamic=True, batch=batch, imgsz=imgsz,
+                                        workspace=4)
+    except Exception as e:  # TensorRT missing, incompatible or not installable
+        print(f"TensorRT export failed ({e}), using PyTorch weights")
+        return pt_path
+    os.replace(exported, engine_path)
+    return engine_path
+
+# 🧪 Frame Preprocessing Function
+def preprocess_frame(frame_gpu, imgsz, bgr=False):
+    """Turn a uint8 frame tensor into a normalized RGB (3, H, W) model input on its device.
+
+    frame_gpu is CHW RGB as decoded by NVDEC, or HWC BGR as read by OpenCV
+    when bgr is set.
+    """
+    if bgr:
+        frame_gpu = frame_gpu.permute(2, 0, 1).flip(0)
+    x = frame_gpu.unsqueeze(0).float().div_(255)
+    return F.interpolate(x, size=imgsz, mode='bilinear', align_corners=False)[0]
+
+# 📸 CUDA Graph Capture Function
+def capture_cuda_graph(net, static_in, warmup=3):
+    """Record one forward pass of net on static_in as a replayable CUDA graph.
+
+    Returns (graph, static_out). New input must be copied into static_in and
+    results read from static_out, since the graph reuses those exact buffers.
+    """
+    stream = torch.cuda.Stream()
+    stream.wait_stream(torch.cuda.current_stream())
+    with torch.inference_mode():
+        with torch.cuda.stream(stream):
+            for _ in range(warmup):
+                net(static_in)
+        torch.cuda.current_stream().wait_stream(stream)
+        graph = torch.cuda.CUDAGraph()
+        with torch.cuda.graph(graph):
+            static_out = net(static_in)
+    return graph, static_out
+
+# 🔍 Detector Setup Function
+def build_detector(weights, batch_size, imgsz, device):
+    """Load YOLO and return detect(batch), giving per-image xyxy/score/class boxes.
+
+    Only the PyTorch fallback (no TensorRT engine) is replayed from a CUDA graph.
+    """
+    backend = AutoBackend(weights, device=device, fp16=device.type != 'cpu')
+    dtype = torch.float16 if backend.fp16 else torch.float32
+    
+    if not (backend.pt and device.type == 'cuda'):
+        def detect(batch):
+            with torch.inference_mode():
+                batch = batch.to(dtype)
+                if device.type == 'cuda':
+                    # TensorRT's synchronous execute is not ordered after work queued on
+                    # the current (possibly per-thread) stream, so finish the input first
+                    torch.cuda.current_stream().synchronize()
+                return ops.non_max_suppression(backend(batch),
+                                               conf_thres=TRACKER_ARGS.track_low_thresh,
+                                               iou_thres=NMS_IOU_THRESHOLD)
+        return detect
+    
+    # PyTorch fallback on CUDA: replay the forward pass from a CUDA graph
+    static_in = torch.zeros((batch_size, 3, *imgsz), dtype=dtype, device=device)
+    graph, static_out = capture_cuda_graph(backend.model, static_in)
+    
+    def detect(batch):
+        static_in[:len(batch)].copy_(batch, non_blocking=True)
+        graph.replay()
+        return ops.non_max_suppression(static_out, conf_thres=TRACKER_ARGS.track_low_thresh,
+                                       iou_thres=NMS_IOU_THRESHOLD)[:len(batch)]
+    return detect
+
+# 🚙 Detection Filtering Functions
+@lru_cache(maxsize=None)
+def vehicle_classes_on(device):
+    """Return VEHICLE_CLASSES as a tensor on the given device, uploaded once."""
+    return torch.as_tensor(VEHICLE_CLASSES, dtype=torch.int32, device=device)
+
+def filter_detections(boxes, scale_x=1.0, scale_y=1.0, min_score=SCORE_THRESHOLD):
+    """Keep vehicle boxes scoring above min_score as an (n, 6) xyxy/score/class array.
+
+    The class and score filter runs where the boxes live, so only the kept
+    rows are copied to the host. Boxes are scaled from model input to frame
+    coordinates on the way.
+    """
+    keep = (torch.isin(boxes[:, 5].int(), vehicle_classes_on(boxes.device))
+            & (boxes[:, 4] > min_score))
+    sel = boxes[keep].float().cpu().numpy()
+    sel[:, :4] *= (scale_x, scale_y, scale_x, scale_y)
+    return sel
+
+# 🖌️ Rectangle Drawing Kernels
+@njit(cache=True)
+def _fill_region(frame, y0, y1, x0, x1, color):
+    """Paint frame[y0:y1, x0:x1] with color, clipped to the frame."""
+    y0, y1 = max(y0, 0), min(y1, frame.shape[0])
+    x0, x1 = max(x0, 0), min(x1, frame.shape[1])
+    for y in range(y0, y1):
+        for x in range(x0, x1):
+            for c in range(frame.shape[2]):
+                frame[y, x, c] = color[c]
+
+@njit(parallel=True, cache=True)
+def draw_rectangles(frame, boxes, color, thickness):
+    """Draw the outline of every (x1, y1, x2, y2) row in boxes into frame."""
+    half = thickness // 2
+    for i in prange(boxes.shape[0]):
+        left, top = boxes[i, 0] - half, boxes[i, 1] - half
+        right, bottom = boxes[i, 2] - half + thickness, boxes[i, 3] - half + thickness
+        _fill_region(frame, top, top + thickness, left, right, color)
+        _fill_region(frame, bottom - thickness, bottom, left, right, color)
+        _fill_region(frame, top, bottom, left, left + thickness, color)
+        _fill_region(frame, top, bottom, right - thickness, right, color)
+
+# ⏱️ Detector Timing Function
+def time_detector(detect, batch_size, imgsz, device, runs=20):
+    """Return the mean seconds per full batch of detect() on a blank input."""
+    batch = torch.zeros((batch_size, 3, *imgsz), device=device)
+    detect(batch)  # Warm up
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    for _ in range(runs):
+        detect(batch)
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+    return (time.perf_counter() - start) / runs
+
+# 🧠 Detector Loading Function
+def load_detector(video_path, imgsz, batch_size, device, int8=False):
+    """Build the detect() function, preferring INT8 only when it is actually faster.
+
+    A badly calibrated INT8 engine can fall back to slow kernels, so it is
+    timed against the FP16 engine before being used.
+    """
+    engine_path = get_engine(MODEL_WEIGHTS, imgsz, batch=batch_size)
+    detect = build_detector(engine_path, batch_size, imgsz, device)
+    if not int8:
+        return detect
+    
+    calib_data = build_calibration_set(video_path, MODEL_WEIGHTS)
+    int8_path = get_engine(MODEL_WEIGHTS, imgsz, batch=batch_size, int8_data=calib_data)
+    if int8_path == MODEL_WEIGHTS:
+        return detect
+    int8_detect = build_detector(int8_path, batch_size, imgsz, device)
+    fp16_time = time_detector(detect, batch_size, imgsz, device)
+    int8_time = time_detector(int8_detect, batch_size, imgsz, device)
+    print(f"Batch latency: FP16 {fp16_time * 1000:.1f} ms, INT8 {int8_time * 1000:.1f} ms")
+    if int8_time < fp16_time:
+        return int8_detect
+    print("INT8 engine is not faster than FP16 (check the calibration), keeping FP16")
+    return detect
 
 # 🎨 Tracking Visualization Function
-def draw_tracking_info(frame, track, track_id, box_color=(0, 0, 255)):
-    """Draw tracking box and ID on frame."""
-    x1, y1, x2, y2 = map(int, track.to_ltrb())
-    cv2.rectangle(frame, (x1, y1), (x2, y2), box_color, 2)
-    cv2.putText(frame, f'ID: {track_id}', (x1, y1 - 10),
-                cv2.FONT_HERSHEY_SIMPLEX, 0.7, box_color, 2)
-    return (x1, y1, x2, y2)
+def draw_tracking_info(frame, boxes, track_ids, box_color=(0, 0, 255)):
+    """Draw tracking boxes and IDs on frame for all tracks at once."""
+    if not boxes:
+        return
+    draw_rectangles(frame, np.array(boxes, dtype=np.int32),
+                    np.array(box_color, dtype=np.uint8), 2)
+    for (x1, y1, _, _), track_id in zip(boxes, track_ids):
+        cv2.putText(frame, f'ID: {track_id}', (x1, y1 - 10),
+                    FONT, 0.7, box_color, 2)
+
+# 🔁 Detection Stage Function
+def detect_vehicles(frames, detect, batch_size, imgsz, scale, device, detect_every=DETECT_EVERY):
+    """Yield (frame, detections) in order for the (frame, frame_gpu) pairs of read_frames().
+
+    Every detect_every-th frame is batched through detect() and gets the
+    array from filter_detections(); the frames in between get None.
+    """
+    # Frames are preprocessed into this buffer and sent to YOLO together
+    batch_buf = torch.empty((batch_size, 3, *imgsz), dtype=torch.float32, device=device)
+    pending = deque()  # (frame, detected) pairs waiting for the batch to run
+    batch_fill = 0
+    frames_read = 0
+    
+    # OpenCV frames go up through pinned staging buffers on a side stream
+    upload_stream = torch.cuda.Stream() if device.type == 'cuda' else None
+    staging = uploaded = None  # Allocated on the first OpenCV-decoded frame
+    
+    try:
+        for frame, frame_gpu in itertools.chain(frames, [(None, None)]):
+            if frame is not None:
+                detected = frames_read % detect_every == 0
+                frames_read += 1
+                if detected:
+                    slot = batch_buf[batch_fill]
+                    if frame_gpu is not None:
+                        # Decoded on another stream when pipelined, keep its memory alive
+                        frame_gpu.record_stream(torch.cuda.current_stream())
+                        slot.copy_(preprocess_frame(frame_gpu, imgsz))
+                    elif upload_stream is None:
+                        slot.copy_(preprocess_frame(torch.from_numpy(frame), imgsz, bgr=True))
+                    else:  # Decoded by OpenCV, upload the raw BGR frame
+                        if staging is None:
+                            staging = torch.empty((batch_size, *frame.shape), dtype=torch.uint8,
+                                                  pin_memory=True)
+                            uploaded = torch.empty_like(staging, device=device)
+                        staging[batch_fill].copy_(torch.from_numpy(frame))
+                        with torch.cuda.stream(upload_stream):
+                            uploaded[batch_fill].copy_(staging[batch_fill], non_blocking=True)
+                            slot.copy_(preprocess_frame(uploaded[batch_fill], imgsz, bgr=True))
+                    batch_fill += 1
+                pending.append((frame, detected))
+                if batch_fill < batch_size:
+                    continue
+            
+            # Detect objects for the whole batch in one call
+            if upload_stream is not None:
+                torch.cuda.current_stream().wait_stream(upload_stream)
+            results_list = iter(detect(batch_buf[:batch_fill]) if batch_fill else [])
+            batch_fill = 0
+            
+            while pending:
+                frame, detected = pending.popleft()
+                detections = None
+                if detected:
+                    detections = filter_detections(next(results_list), *scale,
+                                                   min_score=TRACKER_ARGS.track_low_thresh)
+                yield frame, detections
+    finally:
+        frames.close()
+
+# 🧵 Pipeline Stage Function
+def run_in_thread(iterable, maxsize=4):
+    """Consume iterable on its own thread and CUDA stream, yielding items through a bounded queue.
+
+    Closing the returned generator stops the thread and closes iterable.
+    """
+    items = queue.Queue(maxsize)
+    cancelled = threading.Event()
+    done = object()
+    errors = []
+    
+    @torch.inference_mode()  # Grad mode is per thread
+    def worker():
+        stream = torch.cuda.Stream() if torch.cuda.is_available() else None
+        try:
+            with torch.cuda.stream(stream) if stream is not None else nullcontext():
+                for item in iterable:
+                    if cancelled.is_set():
+                        break
+                    items.put(item)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            iterable.close()
+            items.put(done)
+    
+    thread = threading.Thread(target=worker, daemon=True)
+    thread.start()
+    try:
+        while (item := items.get()) is not done:
+            yield item
+    finally:
+        cancelled.set()
+        while thread.is_alive():  # Keep draining so the worker is never stuck on put()
+            try:
+                items.get(timeout=0.1)
+            except queue.Empty:
+                pass
+    if errors:
+        raise errors[0]
 
 # 🔄 Main Processing Function
-def process_video():
+@torch.inference_mode()
+def process_video(batch_size=BATCH_SIZE, display=False, int8=False, detect_every=DETECT_EVERY,
+                  pipeline=False):
+    if detect_every < 1:
+        raise ValueError(f"detect_every must be at least 1, got {detect_every}")
+    
     try:
         # Initialize
         print("Opening file dialog to select video...")
         video_path = select_video()
         print(f"Selected video: {video_path}")
         
-        print("Loading YOLO model...")
-        model = YOLO("yolov8m.pt")
-        print("YOLO model loaded successfully!")
-        
-        print("Initializing DeepSORT tracker...")
-        tracker = DeepSort(max_age=30)
-        
         print("Opening video capture...")
         cap = cv2.VideoCapture(video_path)
         if not cap.isOpened():
             raise ValueError(f"Could not open video file: {video_path}")
         
-        print("Setting up video writer...")
-        out, output_path = setup_video_writer(video_path, cap)
-        
-        # Get video properties
+        # Get video properties (the engine is built for this input size)
         frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
         frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
         print(f"Video dimensions: {frame_width}x{frame_height}")
+        imgsz = model_input_size(frame_width, frame_height)
+        input_height, input_width = imgsz
+        scale_x = frame_width / input_width
+        scale_y = frame_height / input_height
+        
+        print("Loading YOLO model...")
+        device = torch.device('cuda:0' if torch.cuda.is_available() else 'cpu')
+        torch.backends.cudnn.benchmark = True  # Input shape is fixed, let cuDNN pick the fastest convs
+        detect = load_detector(video_path, imgsz, batch_size, device, int8=int8)
+        print("YOLO model loaded successfully!")
+        
+        # Warm up on a blank frame so engine/cuDNN autotuning and Numba
+        # compilation do not stall the first real frame
+        blank = np.zeros((frame_height, frame_width, 3), dtype=np.uint8)
+        blank_input = preprocess_frame(torch.from_numpy(blank).to(device), imgsz, bgr=True)
+        detect(blank_input.repeat(batch_size, 1, 1, 1))
+        draw_tracking_info(blank, [(0, 0, 1, 1)], [0])
+        
+        print("Initializing ByteTrack tracker...")
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30
+        # The tracker's frame counter only advances on detector frames, so give it
+        # the detection rate to keep track_buffer measured in real video frames
+        tracker = BYTETracker(TRACKER_ARGS, frame_rate=max(1, round(fps / detect_every)))
+        
+        print("Setting up video writer...")
+        out, output_path = setup_video_writer(video_path, cap)
+        out = AsyncVideoWriter(out)
         
         # Tracking parameters
         line_position = frame_height // 2  # Set line to middle of frame
         offset = 10
-        counted_ids = set()
+        counted = bytearray(1 << 16)  # Bitset of counted track ids, grown on demand
         total_count = 0
         
+        # Loop constants and bound methods, looked up once instead of every frame
+        count_top, count_bottom = line_position - offset, line_position + offset
+        line_start, line_end = (0, line_position), (frame_width, line_position)
+        out_write = out.write
+        
         frame_count = 0
+        stop = threading.Event()
+        previous_handler = signal.signal(signal.SIGINT, lambda signum, _: stop.set())
+        
+        # Decode -> detect -> track/annotate/encode, each stage on its own
+        # thread with --pipeline so they overlap instead of running in turn
+        frames = read_frames(video_path, cap, batch_size)
+        if pipeline:
+            frames = run_in_thread(frames)
+        frame_results = detect_vehicles(frames, detect, batch_size, imgsz, (scale_x, scale_y),
+                                        device, detect_every)
+        if pipeline:
+            frame_results = run_in_thread(frame_results)
         print("Starting video processing...")
         
-        while cap.isOpened():
-            ret, frame = cap.read()
-            if not ret:
-                print("End of video reached")
-                break
-                
+        for frame, detections in frame_results:
             frame_count += 1
             if frame_count % 30 == 0:  # Print progress every 30 frames
                 print(f"Processing frame {frame_count}")
             
-            # Detect objects
-            results = model(frame)[0]
-            detections = []
+            # Update tracks, or only advance their Kalman prediction on skipped
+            # frames (an empty update would mark every track as lost)
+            if detections is not None:
+                tracks = tracker.update(Boxes(detections, (frame_height, frame_width)))
+            else:
+                tracker.multi_predict(tracker.tracked_stracks + tracker.lost_stracks)
+                tracks = [t.result for t in tracker.tracked_stracks if t.is_activated]
             
-            for result in results.boxes.data.tolist():
-                x1, y1, x2, y2, score, class_id = result
-                if int(class_id) in [2, 3, 5, 7] and score > 0.4:  # Vehicle classes
-                    detections.append(([x1, y1, x2 - x1, y2 - y1], score, int(class_id)))
-            
-            # Update tracks
-            tracks = tracker.update_tracks(detections, frame=frame)
-            
-            # Process each track
+            # Process each track (rows are x1, y1, x2, y2, id, score, class, index)
+            boxes, track_ids = [], []
             for track in tracks:
-                if not track.is_confirmed():
-                    continue
-                    
-                track_id = track.track_id
-                x1, y1, x2, y2 = draw_tracking_info(frame, track, track_id)
+                x1, y1, x2, y2, track_id = map(int, track[:5])
+                boxes.append((x1, y1, x2, y2))
+                track_ids.append(track_id)
                 cy = int((y1 + y2) / 2)
                 
                 # Count vehicles crossing the line
-                if (line_position - offset) < cy < (line_position + offset):
-                    if track_id not in counted_ids:
-                        counted_ids.add(track_id)
+                if count_top < cy < count_bottom:
+                    byte, bit = track_id >> 3, 1 << (track_id & 7)
+                    if byte >= len(counted):
+                        counted.extend(bytes(max(byte + 1, 2 * len(counted)) - len(counted)))
+                    if not counted[byte] & bit:
+                        counted[byte] |= bit
                         total_count += 1
                         print(f"Vehicle {track_id} counted! Total: {total_count}")
             
+            draw_tracking_info(frame, boxes, track_ids)
+            
             # Draw counting line and display count
-            cv2.line(frame, (0, line_position), (frame.shape[1], line_position), (0, 255, 0), 2)
-            cv2.putText(frame, f'Total Vehicles: {total_count}', (20, 50),
-                        cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 255), 2)
+            cv2.line(frame, line_start, line_end, LINE_COLOR, 2)
+            cv2.putText(frame, f'Total Vehicles: {total_count}', COUNT_ORIGIN,
+                        FONT, 1, COUNT_COLOR, 2)
             
-            # Display and save frame
-            cv2.imshow("Vehicle Tracking", frame)
-            out.write(frame)
+            # Save and optionally display frame
+            out_write(frame)
+            if display:
+                cv2.imshow("Vehicle Tracking", frame)
+                if cv2.waitKey(1) & 0xFF == ord('q'):
+                    stop.set()
             
-            if cv2.waitKey(1) & 0xFF == ord('q'):
+            if stop.is_set():
                 print("Processing stopped by user")
                 break
+        else:
+            print("End of video reached")
         
         # Cleanup
+        signal.signal(signal.SIGINT, previous_handler)
+        frame_results.close()
         cap.release()
         out.release()
-        cv2.destroyAllWindows()
+        if display:
+            cv2.destroyAllWindows()
         print(f"Processing complete! Total vehicles: {total_count}")
         print(f"Output saved: {output_path}")
         return total_count, output_path
@@ -140,13 +680,32 @@ def process_video():
     except Exception as e:
         print(f"An error occurred: {str(e)}")
         # Cleanup in case of error
+        if 'previous_handler' in locals():
+            signal.signal(signal.SIGINT, previous_handler)
+        if 'frame_results' in locals():
+            frame_results.close()
         if 'cap' in locals():
             cap.release()
         if 'out' in locals():
             out.release()
-        cv2.destroyAllWindows()
+        if display:
+            cv2.destroyAllWindows()
         raise
 
 # 🚀 Run the Processing
 if __name__ == "__main__":
-    total_count, output_path = process_video() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Detect, track and count vehicles in a video.")
+    parser.add_argument('--display', action='store_true',
+                        help="show frames while processing (press 'q' or Ctrl+C to stop)")
+    parser.add_argument('--int8', action='store_true',
+                        help="use a calibrated INT8 TensorRT engine if it beats FP16")
+    parser.add_argument('--detect-every', type=int, default=DETECT_EVERY,
+                        help="run the detector on every Nth frame (1 = every frame)")
+    parser.add_argument('--pipeline', action='store_true',
+                        help="run decoding, detection and tracking on separate threads")
+    args = parser.parse_args()
+    if args.detect_every < 1:
+        parser.error("--detect-every must be at least 1")
+    total_count, output_path = process_video(display=args.display, int8=args.int8,
+                                             detect_every=args.detect_every,
+                                             pipeline=args.pipeline) 
\ No newline at end of file